@@ -0,0 +1,71 @@
+import argparse
+import random
+import re
+import time
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain.schema.document import Document
+from populate_database import split_documents_flexibly
+
+WORDS = (
+    "retrieval augmented generation model robustness corpus embedding vector query "
+    "context document section result evaluation baseline adversarial benchmark"
+).split()
+
+def make_corpus(num_pages: int, seed: int = 0) -> list[Document]:
+    """Synthetic PDF-like pages: paragraphs of sentences with the odd hard-wrapped line."""
+    rng = random.Random(seed)
+    pages = []
+    for page in range(num_pages):
+        paragraphs = []
+        for _ in range(rng.randint(3, 8)):
+            sentences = []
+            for _ in range(rng.randint(2, 8)):
+                words = rng.choices(WORDS, k=rng.randint(6, 30))
+                sentences.append(" ".join(words).capitalize() + rng.choice([".", ".", "?", "!"]))
+            paragraphs.append(" ".join(sentences).replace(" model ", " model\n", 1))
+        pages.append(Document(page_content="\n\n".join(paragraphs), metadata={"source": "synthetic.pdf", "page": page}))
+    return pages
+
+def split_documents_legacy(documents: list[Document]):
+    """The previous regex + RecursiveCharacterTextSplitter implementation, kept for comparison."""
+    section_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=800,
+        chunk_overlap=80,
+        length_function=len,
+        is_separator_regex=False
+    )
+
+    final_chunks = []
+    for doc in documents:
+        text = doc.page_content
+        paragraphs = re.split(r"\n\s*\n", text)
+        if len(paragraphs) <= 1:
+            sentences = re.split(r'(?<=[.!?]) +', text)
+            chunks = section_splitter.split_text(" ".join(sentences))
+        else:
+            chunks = section_splitter.split_text(" ".join(paragraphs))
+        for chunk in chunks:
+            final_chunks.append(Document(page_content=chunk, metadata=doc.metadata))
+    return final_chunks
+
+def benchmark(name: str, split_function, documents: list[Document]):
+    start = time.perf_counter()
+    chunks = split_function(documents)
+    elapsed = time.perf_counter() - start
+    megabytes = sum(len(doc.page_content) for doc in documents) / 1e6
+    print(f"{name:>8}: {len(chunks)} chunks in {elapsed:.2f}s ({megabytes / elapsed:.2f} MB/s)")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=5000, help="Number of synthetic pages to split.")
+    args = parser.parse_args()
+
+    documents = make_corpus(args.pages)
+    # Warm the tokenizer cache so its one-off load is not counted.
+    split_documents_flexibly(documents[:1])
+
+    benchmark("legacy", split_documents_legacy, documents)
+    benchmark("token", split_documents_flexibly, documents)
+
+if __name__ == "__main__":
+    main()
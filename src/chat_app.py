@@ -1,9 +1,15 @@
 import os
 import json
+import re
+import time
+import difflib
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 import tkinter as tk
 from tkinter import filedialog, messagebox
 import customtkinter as ctk
-from query_data import query_rag
+from query_data import query_rag, retrieve_chunks, RETRIEVAL_MODELS
 import logging
 import shutil
 
@@ -18,6 +24,14 @@ if not os.path.exists(HISTORY_FOLDER):
     os.makedirs(HISTORY_FOLDER)
 
 
+# Speculative retrieval while the user is typing
+PREFETCH_DEBOUNCE_MS = 400  # Input must be unchanged this long before it is prefetched
+PREFETCH_MIN_CHARS = 8  # Shorter partial inputs are not worth a search
+PREFETCH_MAX_PER_MINUTE = 12  # Caps embedding/search spend on text that may never be sent
+PREFETCH_CACHE_SIZE = 8  # Prefetched retrievals kept per chat
+PREFETCH_MATCH_RATIO = 0.9  # Minimum similarity between sent and prefetched text for reuse
+
+
 # Initialize logging
 logging.basicConfig(
     level=logging.DEBUG,
@@ -44,6 +58,15 @@ class ChatApp(ctk.CTk):
         self.chat_history = {}
         self.selected_model = "mock"
 
+        # Prefetch state: one background worker, a per-chat cache and wasted-work metrics
+        self.prefetch_executor = ThreadPoolExecutor(max_workers=1)
+        self.prefetch_lock = threading.Lock()
+        self.prefetch_after_id = None
+        self.prefetch_inflight = {}  # token -> (future, chat id, match key) of prefetches not yet stored
+        self.prefetch_cache = {}
+        self.prefetch_times = deque()
+        self.prefetch_stats = {"started": 0, "hits": 0, "misses": 0, "wasted": 0, "cancelled": 0, "rate_limited": 0}
+
         # Configure the main layout
         self.columnconfigure(0, weight=1)  # Full width
         self.rowconfigure(1, weight=1)  # Remaining content area
@@ -114,7 +137,7 @@ class ChatApp(ctk.CTk):
         )
 
         self.model_selector = ctk.CTkOptionMenu(left_frame,
-            values=["mock", "gpt-neo", "rag", "minilm", "distilgpt2"],
+            values=["mock", "gpt-neo", "rag", "minilm", "distilgpt2", "assisted", "mistral"],
             command=self.change_model,
         ).grid(row=7, column=0, sticky="ew", padx=5, pady=5)
 
@@ -136,6 +159,7 @@ class ChatApp(ctk.CTk):
         self.input_box = ctk.CTkEntry(input_frame, placeholder_text="Type your message...")
         self.input_box.grid(row=0, column=0, sticky="ew", padx=2)  # No padx
         self.input_box.bind("<Return>", self.send_message_with_event)
+        self.input_box.bind("<KeyRelease>", self.schedule_prefetch)
 
         ctk.CTkButton(input_frame, text="Send", command=self.send_message).grid(
             row=0, column=1, padx=2, sticky="e"  # No padx
@@ -304,6 +328,9 @@ class ChatApp(ctk.CTk):
         if not message.strip():
             return
 
+        # Reuse retrieval prefetched while typing (looked up before a new chat replaces the cache key)
+        results = self.take_prefetched(message)
+
         # Automatically create a new chat if no active chat exists
         if self.current_chat is None:
             self.new_chat()
@@ -312,12 +339,19 @@ class ChatApp(ctk.CTk):
         self._update_chat(f"You: {message}")
 
         # Query the RAG pipeline
-        self.after(500, lambda: self.query_model(message))
+        self.after(500, lambda: self.query_model(message, results))
 
-    def query_model(self, message: str):
+    def query_model(self, message: str, results=None):
         """Query the selected model and display the response."""
         try:
-            response = query_rag(message, self.selected_model)
+            if isinstance(results, Future):
+                # The matching prefetch was still running at send time; its work is reused.
+                try:
+                    results = results.result()
+                except Exception as e:
+                    logging.error(f"Prefetch failed, retrieving again: {e}")
+                    results = None
+            response = query_rag(message, self.selected_model, results=results)
             if response["error"]:
                 self._update_chat(f"Error: {response['error']}")
             else:
@@ -330,6 +364,130 @@ class ChatApp(ctk.CTk):
         except Exception as e:
             self._update_chat(f"Error: {str(e)}")
 
+    @staticmethod
+    def normalize_query(text: str) -> str:
+        """Normalize input so trivially different texts share one prefetch entry."""
+        return re.sub(r"\s+", " ", text).strip().lower().rstrip("?!. ")
+
+    def schedule_prefetch(self, event=None):
+        """Debounce keystrokes: prefetch only once the input has stopped changing."""
+        if self.prefetch_after_id is not None:
+            self.after_cancel(self.prefetch_after_id)
+        self.prefetch_after_id = self.after(PREFETCH_DEBOUNCE_MS, self.start_prefetch)
+
+    def start_prefetch(self):
+        """Run the vector search for the current partial input in the background."""
+        self.prefetch_after_id = None
+        if self.selected_model not in RETRIEVAL_MODELS or not self.input_box.winfo_exists():
+            return
+
+        text = self.input_box.get().strip()
+        key = self.normalize_query(text)
+        if len(key) < PREFETCH_MIN_CHARS:
+            return
+
+        chat_id = self.current_chat
+        with self.prefetch_lock:
+            if key in self.prefetch_cache.get(chat_id, {}):
+                return
+            if any(inflight_chat == chat_id and inflight_key == key
+                   for _future, inflight_chat, inflight_key in self.prefetch_inflight.values()):
+                return
+
+            # Queued prefetches for older input are superseded; a running one is left to finish.
+            for token, (future, _chat, _key) in list(self.prefetch_inflight.items()):
+                if future.cancel():
+                    del self.prefetch_inflight[token]
+                    self.prefetch_stats["cancelled"] += 1
+
+            now = time.monotonic()
+            while self.prefetch_times and now - self.prefetch_times[0] > 60:
+                self.prefetch_times.popleft()
+            if len(self.prefetch_times) >= PREFETCH_MAX_PER_MINUTE:
+                self.prefetch_stats["rate_limited"] += 1
+                return
+            self.prefetch_times.append(now)
+            self.prefetch_stats["started"] += 1
+
+            token = object()
+            future = self.prefetch_executor.submit(self._prefetch_worker, token, chat_id, key, text)
+            self.prefetch_inflight[token] = (future, chat_id, key)
+
+    def _prefetch_worker(self, token, chat_id, key: str, text: str):
+        """Background thread: search with the text as typed and cache it under its normalized key.
+
+        Results are returned as well, for a send that claimed this prefetch while it was running;
+        a claimed or dropped prefetch is no longer in prefetch_inflight and is not cached.
+        """
+        try:
+            results = retrieve_chunks(text, k=5)
+        except Exception as e:
+            logging.error(f"Prefetch failed for '{text}': {e}")
+            with self.prefetch_lock:
+                if self.prefetch_inflight.pop(token, None) is not None:
+                    self.prefetch_stats["wasted"] += 1
+            raise
+
+        with self.prefetch_lock:
+            if self.prefetch_inflight.pop(token, None) is not None:
+                cache = self.prefetch_cache.setdefault(chat_id, OrderedDict())
+                cache[key] = results
+                cache.move_to_end(key)
+                while len(cache) > PREFETCH_CACHE_SIZE:
+                    cache.popitem(last=False)
+                    self.prefetch_stats["wasted"] += 1
+        logging.debug(f"Prefetched retrieval for '{text}'")
+        return results
+
+    @staticmethod
+    def _closest_prefetch(key: str, candidates):
+        """Return the value whose key best matches key, or None if none reaches PREFETCH_MATCH_RATIO."""
+        best, best_ratio = None, 0.0
+        for candidate_key, value in candidates:
+            ratio = difflib.SequenceMatcher(None, key, candidate_key).ratio()
+            if ratio > best_ratio:
+                best, best_ratio = value, ratio
+        return best if best_ratio >= PREFETCH_MATCH_RATIO else None
+
+    def take_prefetched(self, message: str):
+        """Return prefetched results (or a running prefetch's future) matching the sent message.
+
+        Everything else prefetched for the chat is dropped and counted as wasted.
+        """
+        if self.prefetch_after_id is not None:
+            self.after_cancel(self.prefetch_after_id)
+            self.prefetch_after_id = None
+        if self.selected_model not in RETRIEVAL_MODELS:
+            return None
+
+        key = self.normalize_query(message)
+        with self.prefetch_lock:
+            cache = self.prefetch_cache.pop(self.current_chat, OrderedDict())
+            inflight = {
+                token: entry for token, entry in self.prefetch_inflight.items() if entry[1] == self.current_chat
+            }
+            for token in inflight:
+                del self.prefetch_inflight[token]
+
+            # Finished results win over running ones, so a near-match in the cache is taken even if a
+            # running prefetch matches slightly better; either must near-match the sent text.
+            results = self._closest_prefetch(key, cache.items())
+            if results is None:
+                results = self._closest_prefetch(key, ((inflight_key, future) for future, _chat, inflight_key in inflight.values()))
+            self.prefetch_stats["hits" if results is not None else "misses"] += 1
+
+            # Drop the rest: unclaimed running prefetches will see they are no longer in flight.
+            for future, _chat, _key in inflight.values():
+                if future is results:
+                    continue
+                self.prefetch_stats["cancelled" if future.cancel() else "wasted"] += 1
+            self.prefetch_stats["wasted"] += len(cache) - (0 if results is None or isinstance(results, Future) else 1)
+            stats = dict(self.prefetch_stats)
+
+        state = "miss" if results is None else ("hit (in flight)" if isinstance(results, Future) else "hit")
+        logging.info(f"Prefetch {state} for '{key}'; stats: {stats}")
+        return results
+
     def _update_chat(self, message: str):
         """Update the chat display."""
         self.chat_display.configure(state="normal")
@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+from collections import Counter, defaultdict
+import numpy as np
+from langchain.schema.document import Document
+
+DEDUP_INDEX_FILE = "dedup_index.json.gz"
+DEFAULT_THRESHOLD = 0.8  # Estimated Jaccard similarity above which a chunk counts as a duplicate
+SHINGLE_SIZE = 5  # Words per shingle
+NUM_PERMUTATIONS = 64
+NUM_BANDS = 16  # LSH bands of NUM_PERMUTATIONS // NUM_BANDS rows each
+PERMUTATION_SEED = 1
+INDEX_FORMAT = 2
+PRIME = (1 << 31) - 1
+
+EDGE_LINES = 2  # Lines at the top and bottom of a page checked for running headers/footers
+MIN_EDGE_LINE_SHARE = 0.6  # Fraction of a document's pages a line must repeat on to be stripped
+MIN_PAGES_FOR_EDGE_LINES = 3
+# Header stripping changes chunk text and therefore positional chunk IDs; bump on any change.
+HEADER_STRIPPING_VERSION = f"edges-{EDGE_LINES}-{MIN_EDGE_LINE_SHARE}-v1"
+
+_rng = np.random.default_rng(PERMUTATION_SEED)
+_PERM_A = _rng.integers(1, PRIME, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.integers(0, PRIME, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+def minhash_signature(text: str) -> list[int]:
+    words = re.findall(r"\w+", text.lower())
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little") for shingle in shingles],
+        dtype=np.uint64,
+    )
+    permuted = (np.outer(_PERM_A, hashes) + _PERM_B[:, None]) % np.uint64(PRIME)
+    return permuted.min(axis=1).tolist()
+
+def _text_digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+class NearDuplicateIndex:
+    """Persistent MinHash LSH index mapping near-duplicate chunks to a canonical chunk ID."""
+
+    def __init__(self, path: str, threshold: float = DEFAULT_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.signatures = {}  # canonical chunk id -> MinHash signature
+        self.buckets = defaultdict(list)  # "band:hash" -> canonical chunk ids
+        self.duplicates = {}  # duplicate chunk id -> {"canonical": chunk id, "digest": text digest}
+        self.unlinked = defaultdict(set)  # canonical chunk id -> ids whose link was dropped this run
+
+        if os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as file:
+                data = json.load(file)
+            if (data.get("format") == INDEX_FORMAT and data.get("num_permutations") == NUM_PERMUTATIONS
+                    and data.get("seed") == PERMUTATION_SEED):
+                self.signatures = data["signatures"]
+                self.duplicates = data["duplicates"]
+                for chunk_id, signature in self.signatures.items():
+                    for key in self._band_keys(signature):
+                        self.buckets[key].append(chunk_id)
+
+    @staticmethod
+    def _band_keys(signature: list[int]) -> list[str]:
+        rows = NUM_PERMUTATIONS // NUM_BANDS
+        return [f"{band}:{hash(tuple(signature[band * rows:(band + 1) * rows]))}" for band in range(NUM_BANDS)]
+
+    def is_linked(self, chunk_id: str, text: str) -> bool:
+        """True if chunk_id was already linked as a duplicate and its text has not changed since."""
+        link = self.duplicates.get(chunk_id)
+        return link is not None and link["digest"] == _text_digest(text)
+
+    def find_or_add(self, chunk_id: str, text: str):
+        """Return the canonical chunk ID if text is a near-duplicate, otherwise index it and return None."""
+        digest = _text_digest(text)
+        link = self.duplicates.get(chunk_id)
+        if link is not None:
+            if link["digest"] == digest:
+                return link["canonical"]
+            # The chunk at this position changed, so the earlier decision no longer applies.
+            del self.duplicates[chunk_id]
+            self.unlinked[link["canonical"]].add(chunk_id)
+
+        signature = minhash_signature(text)
+        band_keys = self._band_keys(signature)
+
+        candidates = {candidate for key in band_keys for candidate in self.buckets.get(key, ())}
+        candidates.discard(chunk_id)
+        for candidate in candidates:
+            similarity = np.mean(np.equal(signature, self.signatures[candidate]))
+            if similarity >= self.threshold:
+                self.duplicates[chunk_id] = {"canonical": candidate, "digest": digest}
+                return candidate
+
+        if chunk_id not in self.signatures:
+            for key in band_keys:
+                self.buckets[key].append(chunk_id)
+        self.signatures[chunk_id] = signature
+        return None
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with gzip.open(temp_path, "wt", encoding="utf-8") as file:
+            json.dump({
+                "format": INDEX_FORMAT,
+                "num_permutations": NUM_PERMUTATIONS,
+                "seed": PERMUTATION_SEED,
+                "signatures": self.signatures,
+                "duplicates": self.duplicates,
+            }, file)
+        os.replace(temp_path, self.path)
+
+def _normalize_edge_line(line: str) -> str:
+    # Page numbers differ from page to page, so compare lines with digits masked out.
+    return re.sub(r"\d+", "#", line.strip().lower())
+
+def strip_repeated_headers(documents: list[Document]) -> list[Document]:
+    """Remove header/footer lines that repeat at the top or bottom of most pages of a document."""
+    pages_by_source = defaultdict(list)
+    for doc in documents:
+        pages_by_source[doc.metadata.get("source")].append(doc)
+
+    stripped = []
+    for pages in pages_by_source.values():
+        if len(pages) < MIN_PAGES_FOR_EDGE_LINES:
+            stripped.extend(pages)
+            continue
+
+        counts = Counter()
+        for doc in pages:
+            lines = [line for line in doc.page_content.splitlines() if line.strip()]
+            edges = {_normalize_edge_line(line) for line in lines[:EDGE_LINES] + lines[-EDGE_LINES:]}
+            counts.update(edges)
+        repeated = {line for line, count in counts.items() if count >= MIN_EDGE_LINE_SHARE * len(pages)}
+
+        for doc in pages:
+            lines = doc.page_content.splitlines()
+            content = [index for index, line in enumerate(lines) if line.strip()]
+            edge_indexes = set(content[:EDGE_LINES] + content[-EDGE_LINES:])
+            kept = [
+                line for index, line in enumerate(lines)
+                if index not in edge_indexes or _normalize_edge_line(line) not in repeated
+            ]
+            stripped.append(Document(page_content="\n".join(kept), metadata=doc.metadata))
+
+    return stripped
@@ -0,0 +1,50 @@
+import logging
+import chromadb
+import numpy as np
+
+CHROMA_PATH = "chroma"
+COLLECTION_NAME = "example_collection"  # Chunk collection shared by ingestion and queries
+ROUTES_COLLECTION = "document_routes"
+
+def get_routes_collection():
+    """Open (or create) the collection holding one centroid embedding per document."""
+    client = chromadb.PersistentClient(path=CHROMA_PATH)
+    return client.get_or_create_collection(ROUTES_COLLECTION, metadata={"hnsw:space": "cosine"})
+
+def build_document_routes(vector_store, sources):
+    """Recompute the routing centroid of every given source from its stored chunk embeddings."""
+    routes = get_routes_collection()
+
+    for source in sorted(set(sources)):
+        items = vector_store.get(where={"source": source}, include=["embeddings"])
+        embeddings = items.get("embeddings")
+        if embeddings is None or len(embeddings) == 0:
+            # Every chunk of this document is gone, so it should no longer be routed to.
+            routes.delete(ids=[source])
+            continue
+
+        centroid = np.asarray(embeddings, dtype=np.float32).mean(axis=0)
+        norm = np.linalg.norm(centroid)
+        if norm > 0:
+            centroid /= norm
+
+        routes.upsert(
+            ids=[source],
+            embeddings=[centroid.tolist()],
+            metadatas=[{"source": source, "chunks": len(embeddings)}],
+        )
+        logging.debug(f"Routing centroid updated for {source} ({len(embeddings)} chunks)")
+
+def route_query(query_embedding, top_n: int) -> list:
+    """Return the sources of the top_n documents closest to the query, or [] if no routes exist."""
+    routes = get_routes_collection()
+    count = routes.count()
+    if count == 0:
+        return []
+
+    result = routes.query(
+        query_embeddings=[query_embedding],
+        n_results=min(top_n, count),
+        include=["metadatas"],
+    )
+    return [metadata["source"] for metadata in result["metadatas"][0]]
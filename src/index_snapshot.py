@@ -0,0 +1,153 @@
+import gzip
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime, timezone
+import numpy as np
+
+SNAPSHOT_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+STATE_FILE = "state.json.gz"  # Content digest of every chunk present at export time
+EXPORT_BATCH_SIZE = 5000  # Rows read from Chroma and written per part file
+IMPORT_BATCH_SIZE = 5000  # Rows upserted into Chroma per call
+
+def _digest(document: str, metadata: dict) -> str:
+    payload = json.dumps([document, metadata], sort_keys=True).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()
+
+def _read_json_gz(path: str):
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        return json.load(file)
+
+def _write_json_gz(path: str, data):
+    with gzip.open(path, "wt", encoding="utf-8") as file:
+        json.dump(data, file)
+
+def read_manifest(snapshot_path: str) -> dict:
+    with open(os.path.join(snapshot_path, MANIFEST_FILE), "r") as file:
+        manifest = json.load(file)
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format version: {manifest.get('format_version')}")
+    return manifest
+
+def export_snapshot(collection, snapshot_path: str, embedding_model: str, ingest_version: str = None,
+                    base_path: str = None) -> dict:
+    """Write the collection as a columnar snapshot: float32 vector parts plus gzip'd id/text/metadata columns.
+
+    With base_path, only chunks that are new or changed since that snapshot are written and
+    chunks that disappeared are listed as deletions.
+    """
+    base_manifest = read_manifest(base_path) if base_path else None
+    base_state = _read_json_gz(os.path.join(base_path, STATE_FILE)) if base_path else {}
+
+    os.makedirs(snapshot_path, exist_ok=False)
+    state = {}
+    parts = []
+    dimension = None
+    offset = 0
+
+    while True:
+        batch = collection.get(
+            include=["embeddings", "documents", "metadatas"],
+            limit=EXPORT_BATCH_SIZE,
+            offset=offset,
+        )
+        if not batch["ids"]:
+            break
+        offset += len(batch["ids"])
+
+        selected = []
+        for index, (chunk_id, document, metadata) in enumerate(zip(batch["ids"], batch["documents"], batch["metadatas"])):
+            digest = _digest(document, metadata)
+            state[chunk_id] = digest
+            if base_state.get(chunk_id) != digest:
+                selected.append(index)
+        if not selected:
+            continue
+
+        vectors = np.asarray(batch["embeddings"], dtype=np.float32)[selected]
+        dimension = vectors.shape[1]
+        name = f"part-{len(parts):05d}"
+        np.save(os.path.join(snapshot_path, f"{name}.npy"), vectors)
+        _write_json_gz(os.path.join(snapshot_path, f"{name}.json.gz"), {
+            "ids": [batch["ids"][i] for i in selected],
+            "documents": [batch["documents"][i] for i in selected],
+            "metadatas": [batch["metadatas"][i] for i in selected],
+        })
+        parts.append({"vectors": f"{name}.npy", "records": f"{name}.json.gz", "count": len(selected)})
+
+    _write_json_gz(os.path.join(snapshot_path, STATE_FILE), state)
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "snapshot_id": uuid.uuid4().hex,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "embedding_model": embedding_model,
+        "ingest_version": ingest_version,
+        "dimension": dimension,
+        "count": sum(part["count"] for part in parts),
+        "base_snapshot": base_manifest["snapshot_id"] if base_manifest else None,
+        "deleted_ids": sorted(set(base_state) - set(state)),
+        "parts": parts,
+    }
+    with open(os.path.join(snapshot_path, MANIFEST_FILE), "w") as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+def import_snapshot(collection, snapshot_path: str, embedding_model: str, current_snapshot: str = None) -> tuple[dict, set]:
+    """Bulk-load a full or delta snapshot into the collection.
+
+    current_snapshot is the ID of the last snapshot loaded into the collection; a delta is only
+    accepted on top of the snapshot it was exported against. Returns the manifest and the set of
+    sources whose chunks were added, changed or deleted.
+    """
+    manifest = read_manifest(snapshot_path)
+    if manifest["embedding_model"] != embedding_model:
+        raise ValueError(
+            f"Snapshot was built with '{manifest['embedding_model']}', but this node uses '{embedding_model}'"
+        )
+    if manifest["base_snapshot"] and manifest["base_snapshot"] != current_snapshot:
+        raise ValueError(
+            f"Delta snapshot expects base {manifest['base_snapshot']}, but the database is at {current_snapshot}"
+        )
+    if not manifest["base_snapshot"] and collection.count() > 0:
+        # Upserting would leave behind chunks that are not in the snapshot.
+        raise ValueError("A full snapshot can only be imported into an empty database; use --reset")
+
+    sample = collection.get(limit=1, include=["embeddings"])["embeddings"]
+    if sample is not None and len(sample) and manifest["dimension"] and len(sample[0]) != manifest["dimension"]:
+        raise ValueError(
+            f"Snapshot vectors have dimension {manifest['dimension']}, but the collection uses {len(sample[0])}"
+        )
+
+    # Validate every part before touching the collection so a bad snapshot cannot half-apply.
+    for part in manifest["parts"]:
+        shape = np.load(os.path.join(snapshot_path, part["vectors"]), mmap_mode="r").shape
+        if shape != (part["count"], manifest["dimension"]):
+            raise ValueError(f"{part['vectors']} has shape {shape}, expected ({part['count']}, {manifest['dimension']})")
+
+    touched_sources = set()
+
+    deleted_ids = manifest["deleted_ids"]
+    for start in range(0, len(deleted_ids), IMPORT_BATCH_SIZE):
+        batch_ids = deleted_ids[start:start + IMPORT_BATCH_SIZE]
+        deleted = collection.get(ids=batch_ids, include=["metadatas"])
+        touched_sources.update(metadata.get("source") for metadata in deleted["metadatas"])
+        collection.delete(ids=batch_ids)
+
+    for part in manifest["parts"]:
+        vectors = np.load(os.path.join(snapshot_path, part["vectors"]))
+        records = _read_json_gz(os.path.join(snapshot_path, part["records"]))
+        touched_sources.update(metadata.get("source") for metadata in records["metadatas"])
+        for start in range(0, len(records["ids"]), IMPORT_BATCH_SIZE):
+            end = start + IMPORT_BATCH_SIZE
+            collection.upsert(
+                ids=records["ids"][start:end],
+                embeddings=vectors[start:end],
+                documents=records["documents"][start:end],
+                metadatas=records["metadatas"][start:end],
+            )
+
+    touched_sources.discard(None)
+    return manifest, touched_sources
@@ -0,0 +1,149 @@
+import copy
+import logging
+from collections import OrderedDict
+import torch
+
+# Upper bound for cached key/values across all prefixes. Every entry holds the whole prefix up
+# to its boundary, so a chain of n cached segments stores the preamble n times.
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+MAX_SEEN_BOUNDARIES = 4096  # Boundaries remembered so a repeated one can be cached on its next use
+
+def _cache_nbytes(past_key_values) -> int:
+    """Approximate memory used by a past_key_values structure (legacy tuples or a Cache object)."""
+    if past_key_values is None:
+        return 0
+    if torch.is_tensor(past_key_values):
+        return past_key_values.element_size() * past_key_values.nelement()
+    if hasattr(past_key_values, "layers"):
+        # transformers Cache objects (e.g. DynamicCache) keep one keys/values pair per layer.
+        return sum(_cache_nbytes(layer.keys) + _cache_nbytes(layer.values) for layer in past_key_values.layers)
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return _cache_nbytes(past_key_values.to_legacy_cache())
+    if isinstance(past_key_values, (tuple, list)):
+        return sum(_cache_nbytes(item) for item in past_key_values)
+    return 0
+
+class PrefixKVCache:
+    """LRU store of past key/values for prompt prefixes, bounded by memory.
+
+    Prompts are passed as a list of text segments (template preamble, context blocks, ...).
+    Only exact chains of leading segments can be reused, so the key/values are cached after
+    the preamble and after any later boundary that an earlier prompt already reached; a
+    one-off combination of context blocks is never stored.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.entries = OrderedDict()  # (model name, token ids) -> (past_key_values, nbytes)
+        self.seen = OrderedDict()  # (model name, token ids) of boundaries reached by earlier prompts
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def _put(self, key, past_key_values):
+        nbytes = _cache_nbytes(past_key_values)
+        if past_key_values is not None and nbytes == 0:
+            # An unmeasurable entry would never be evicted, so refuse it instead of growing unbounded.
+            logging.warning(f"KV prefix cache cannot measure {type(past_key_values).__name__}; not caching")
+            return
+        if nbytes > self.max_bytes:
+            return
+        if key in self.entries:
+            self.current_bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (past_key_values, nbytes)
+        self.current_bytes += nbytes
+        while self.current_bytes > self.max_bytes:
+            _evicted_key, (_past, evicted_bytes) = self.entries.popitem(last=False)
+            self.current_bytes -= evicted_bytes
+
+    def _should_cache(self, key, index: int) -> bool:
+        if index == 0 or key in self.seen:
+            return True
+        self.seen[key] = None
+        if len(self.seen) > MAX_SEEN_BOUNDARIES:
+            self.seen.popitem(last=False)
+        return False
+
+    def clear(self):
+        self.entries.clear()
+        self.seen.clear()
+        self.current_bytes = 0
+
+    @torch.no_grad()
+    def prefill(self, model, tokenizer, prefix_segments: list):
+        """Return (prefix token ids, past_key_values) for the concatenated segments.
+
+        The longest already-cached run of leading segments is reused; only the remaining
+        segments are run through the model. The preamble boundary is always cached, deeper
+        boundaries only once they repeat.
+        """
+        model_name = model.config.name_or_path
+
+        boundaries = []
+        token_ids = []
+        for segment in prefix_segments:
+            token_ids = token_ids + tokenizer.encode(segment, add_special_tokens=not token_ids)
+            boundaries.append(tuple(token_ids))
+
+        # Find the longest cached prefix.
+        start, past_key_values = 0, None
+        for index in range(len(boundaries) - 1, -1, -1):
+            cached = self._get((model_name, boundaries[index]))
+            if cached is not None:
+                start, past_key_values = index + 1, cached
+                break
+
+        if start:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        # Extend the reused cache segment by segment. Forward passes may update a Cache object
+        # in place, so always work on a copy and never on the stored entry itself.
+        for index in range(start, len(boundaries)):
+            key = (model_name, boundaries[index])
+            previous_length = len(boundaries[index - 1]) if index else 0
+            new_ids = torch.tensor([boundaries[index][previous_length:]], dtype=torch.long)
+            if new_ids.shape[1]:
+                outputs = model(
+                    input_ids=new_ids,
+                    past_key_values=copy.deepcopy(past_key_values),
+                    use_cache=True,
+                )
+                past_key_values = outputs.past_key_values
+            if self._should_cache(key, index):
+                self._put(key, past_key_values)
+
+        reused_tokens = len(boundaries[start - 1]) if start else 0
+        logging.info(
+            f"KV prefix cache: reused {start}/{len(boundaries)} segments ({reused_tokens}/{len(token_ids)} tokens) "
+            f"for {model_name}; hits {self.hits}, misses {self.misses}, "
+            f"{self.current_bytes / 2**20:.1f} MiB in {len(self.entries)} entries"
+        )
+        return token_ids, past_key_values
+
+    @torch.no_grad()
+    def generate(self, model, tokenizer, prefix_segments: list, suffix: str, max_length: int, **generate_kwargs):
+        """Generate from prefix + suffix, prefilling only the tokens not covered by the cache."""
+        prefix_ids, past_key_values = self.prefill(model, tokenizer, prefix_segments)
+        suffix_ids = tokenizer.encode(suffix, add_special_tokens=not prefix_ids)
+
+        input_ids = torch.tensor([(prefix_ids + suffix_ids)[:max_length]], dtype=torch.long)
+        if input_ids.shape[1] <= len(prefix_ids):
+            # The prompt was truncated inside the prefix, so the cached key/values do not line up.
+            past_key_values = None
+
+        return model.generate(
+            input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=copy.deepcopy(past_key_values),
+            max_length=max_length,
+            **generate_kwargs,
+        )
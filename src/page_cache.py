@@ -0,0 +1,60 @@
+import gzip
+import hashlib
+import json
+import os
+import pypdf
+from langchain_community.document_loaders import PyPDFLoader
+from langchain.schema.document import Document
+
+PAGE_CACHE_PATH = "page_cache"
+# Bump when the extraction pipeline changes so stale text is never reused.
+EXTRACTOR_VERSION = f"pypdf-{pypdf.__version__}-1"
+
+def file_content_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def cache_entry_path(content_hash: str) -> str:
+    return os.path.join(PAGE_CACHE_PATH, f"{content_hash}-{EXTRACTOR_VERSION}.json.gz")
+
+def load_pdf_pages(file_path: str, content_hash: str, reparse: bool = False) -> tuple[list[Document], bool]:
+    """Return the pages of a PDF and whether they came from the cache.
+
+    Extracted text and loader metadata are stored compressed, keyed by the file's content hash
+    and the extractor version, so unchanged PDFs are never parsed twice.
+    """
+    entry_path = cache_entry_path(content_hash)
+
+    if not reparse and os.path.exists(entry_path):
+        with gzip.open(entry_path, "rt", encoding="utf-8") as file:
+            pages = json.load(file)
+        # The same content may have been cached under another path; keep the current one.
+        return [
+            Document(page_content=page["page_content"], metadata={**page["metadata"], "source": file_path})
+            for page in pages
+        ], True
+
+    documents = PyPDFLoader(file_path).load()
+
+    os.makedirs(PAGE_CACHE_PATH, exist_ok=True)
+    temp_path = f"{entry_path}.tmp"
+    with gzip.open(temp_path, "wt", encoding="utf-8") as file:
+        json.dump([{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents], file)
+    os.replace(temp_path, entry_path)
+
+    return documents, False
+
+def prune_page_cache(content_hashes: set) -> int:
+    """Delete cache entries that match no current file (or an older extractor); return how many."""
+    if not os.path.isdir(PAGE_CACHE_PATH):
+        return 0
+    live_entries = {os.path.basename(cache_entry_path(content_hash)) for content_hash in content_hashes}
+    removed = 0
+    for entry in os.listdir(PAGE_CACHE_PATH):
+        if entry not in live_entries:
+            os.remove(os.path.join(PAGE_CACHE_PATH, entry))
+            removed += 1
+    return removed
@@ -1,73 +1,105 @@
 import argparse
+import json
 import os
 import shutil
-from langchain_community.document_loaders import PyPDFDirectoryLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from collections import defaultdict
+from pathlib import Path
 from langchain.schema.document import Document
 from get_embedding_function import get_embedding_function
 from langchain_chroma import Chroma  # Updated import from the new package
-import re
+import chromadb
+from document_router import COLLECTION_NAME, build_document_routes, get_routes_collection
+from page_cache import file_content_hash, load_pdf_pages, prune_page_cache
+from token_chunker import CHUNKER_VERSION, split_text
+from dedup import DEDUP_INDEX_FILE, DEFAULT_THRESHOLD, HEADER_STRIPPING_VERSION, NearDuplicateIndex, strip_repeated_headers
+from index_snapshot import export_snapshot, import_snapshot
 
 CHROMA_PATH = "chroma"
 DATA_PATH = "data"
+INGEST_VERSION = f"{CHUNKER_VERSION}+{HEADER_STRIPPING_VERSION}"  # How pages became chunks; stored with the database
+INGEST_VERSION_FILE = "ingest_version.json"
+DUPLICATE_ID_SEPARATOR = "; "  # Chroma metadata values must be scalars, so linked IDs are joined
+SNAPSHOT_MARKER_FILE = "snapshot.json"  # ID of the last snapshot imported into CHROMA_PATH
 
 def main():
 
     # Check if the database should be cleared (using the --clear flag).
     parser = argparse.ArgumentParser()
     parser.add_argument("--reset", action="store_true", help="Reset the database.")
+    parser.add_argument("--reparse", action="store_true", help="Re-extract PDF text instead of using the page cache.")
+    parser.add_argument("--dedup-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Similarity above which a chunk is linked to an existing one instead of embedded.")
+    subparsers = parser.add_subparsers(dest="command")
+    export_parser = subparsers.add_parser("export", help="Write the database to a portable snapshot.")
+    export_parser.add_argument("path", help="Directory to create for the snapshot.")
+    export_parser.add_argument("--base", help="Earlier snapshot to write a delta against.")
+    import_parser = subparsers.add_parser(
+        "import", help="Load a snapshot (or delta) into the database; full snapshots need an empty database or --reset."
+    )
+    import_parser.add_argument("path", help="Snapshot directory to load.")
     args = parser.parse_args()
 
     if args.reset:
         print("✨ Clearing Database")
         clear_database()
 
+    if args.command == "export":
+        export_database(args.path, base_path=args.base)
+        return
+    if args.command == "import":
+        import_database(args.path)
+        return
+
     # Create (or update) the data store.
-    documents = load_documents()
+    documents = load_documents(reparse=args.reparse)
+    documents = strip_repeated_headers(documents)
     chunks = split_documents_flexibly(documents)
-    add_to_chroma(chunks)
+    add_to_chroma(chunks, dedup_threshold=args.dedup_threshold)
 
-def load_documents():
-    document_loader = PyPDFDirectoryLoader(DATA_PATH)
-    return document_loader.load()
+def load_documents(reparse: bool = False):
+    documents = []
+    parsed_files = 0
+    content_hashes = set()
 
-def split_documents_flexibly(documents: list[Document]):
-    section_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=800,
-        chunk_overlap=80,
-        length_function=len,
-        is_separator_regex=False  # No strict regex for sections
-    )
+    # Same file selection as PyPDFDirectoryLoader, but extracted pages come from the page cache.
+    for pdf_path in sorted(Path(DATA_PATH).glob("**/[!.]*.pdf")):
+        if not _is_visible(pdf_path.relative_to(DATA_PATH)):
+            continue
+        content_hash = file_content_hash(str(pdf_path))
+        content_hashes.add(content_hash)
+        pages, from_cache = load_pdf_pages(str(pdf_path), content_hash, reparse=reparse)
+        documents.extend(pages)
+        if not from_cache:
+            parsed_files += 1
 
+    print(f"📄 Loaded {len(documents)} pages ({parsed_files} file(s) parsed, the rest from cache)")
+    pruned = prune_page_cache(content_hashes)
+    if pruned:
+        print(f"🧹 Removed {pruned} stale page cache entries")
+    return documents
+
+def _is_visible(path: Path) -> bool:
+    # PyPDFDirectoryLoader skips anything inside hidden directories.
+    return not any(part.startswith(".") for part in path.parts)
+
+def split_documents_flexibly(documents: list[Document]):
     final_chunks = []
 
-    # Splitting by paragraphs or sentences
+    # Single pass per page: sentence/paragraph-aware chunks sized in embedding-model tokens
     for doc in documents:
-        text = doc.page_content  # Access the document content
-        # First, attempt splitting by paragraph (if possible)
-        paragraphs = re.split(r"\n\s*\n", text)  # Split by blank lines (paragraphs)
-
-        if len(paragraphs) <= 1:
-            # If the text does not contain paragraphs, fall back to sentence splitting
-            sentences = re.split(r'(?<=[.!?]) +', text)  # Split by sentence boundaries
-            chunks = section_splitter.split_text(" ".join(sentences))
-        else:
-            # Further split paragraphs if they're too long
-            chunks = section_splitter.split_text(" ".join(paragraphs))
-
-        # Create new Document objects from the split chunks
-        for chunk in chunks:
-            final_chunks.append(Document(page_content=chunk, metadata=doc.metadata))
+        for chunk, token_count in split_text(doc.page_content):
+            # Token counts are kept for prompt budgeting at query time
+            final_chunks.append(Document(page_content=chunk, metadata={**doc.metadata, "tokens": token_count}))
 
     return final_chunks
 
-def add_to_chroma(chunks: list[Document]):
+def add_to_chroma(chunks: list[Document], dedup_threshold: float = DEFAULT_THRESHOLD):
     # Use the new `Chroma` from langchain_chroma package
     embeddings = get_embedding_function()
 
     # Initialize the Chroma vector store
     vector_store = Chroma(
-        collection_name="example_collection",
+        collection_name=COLLECTION_NAME,
         embedding_function=embeddings,
         persist_directory=CHROMA_PATH,  # Automatically persists data
     )
@@ -80,12 +112,45 @@ def add_to_chroma(chunks: list[Document]):
     existing_ids = set(existing_items["ids"])
     print(f"Number of existing documents in DB: {len(existing_ids)}")
 
+    # Chunk IDs are positional, so chunks from another chunking pipeline cannot be mixed in.
+    stored_version = read_ingest_version()
+    if existing_ids and stored_version != INGEST_VERSION:
+        print(f"❌ Database was built with chunking '{stored_version}', but the current chunking is "
+              f"'{INGEST_VERSION}'. Run with --reset to rebuild it.")
+        return
+    write_ingest_version()
+
     # Only add documents that don't exist in the DB.
     new_chunks = []
     for chunk in chunks_with_ids:
         if chunk.metadata["id"] not in existing_ids:
             new_chunks.append(chunk)
 
+    # Link near-duplicates to their canonical chunk instead of embedding them again. Duplicates
+    # are never stored, so drop the ones linked by an earlier run before counting new links.
+    dedup_index = NearDuplicateIndex(os.path.join(CHROMA_PATH, DEDUP_INDEX_FILE), threshold=dedup_threshold)
+    new_chunks = [chunk for chunk in new_chunks if not dedup_index.is_linked(chunk.metadata["id"], chunk.page_content)]
+    unique_chunks = []
+    duplicate_links = defaultdict(set)  # canonical chunk id -> ids of chunks linked to it
+    skipped_tokens = 0
+    for chunk in new_chunks:
+        canonical_id = dedup_index.find_or_add(chunk.metadata["id"], chunk.page_content)
+        if canonical_id is None:
+            unique_chunks.append(chunk)
+        else:
+            duplicate_links[canonical_id].add(chunk.metadata["id"])
+            skipped_tokens += chunk.metadata.get("tokens", 0)
+    if len(unique_chunks) < len(new_chunks):
+        print(f"♻️ Skipped near-duplicate chunks: {len(new_chunks) - len(unique_chunks)} (~{skipped_tokens} embedding tokens saved)")
+    new_chunks = unique_chunks
+
+    # Record the links on the canonical chunks so retrieval can point at every copy.
+    for chunk in new_chunks:
+        linked_ids = duplicate_links.pop(chunk.metadata["id"], None)
+        if linked_ids:
+            chunk.metadata["duplicate_ids"] = DUPLICATE_ID_SEPARATOR.join(sorted(linked_ids))
+    update_duplicate_links(duplicate_links, dedup_index.unlinked)
+
     if len(new_chunks):
         print(f"👉 Adding new documents: {len(new_chunks)}")
         new_chunk_ids = [chunk.metadata["id"] for chunk in new_chunks]
@@ -93,6 +158,33 @@ def add_to_chroma(chunks: list[Document]):
         # No need to call vector_store.persist(), since it's handled by the persist_directory
     else:
         print("✅ No new documents to add")
+    dedup_index.save()
+
+    # Refresh the per-document routing centroids used to prune query-time search.
+    routed_sources = {chunk.metadata.get("source") for chunk in new_chunks}
+    if get_routes_collection().count() == 0:
+        routed_sources = {chunk.metadata.get("source") for chunk in chunks_with_ids}
+    if routed_sources:
+        print(f"🧭 Updating routing index for {len(routed_sources)} document(s)")
+        build_document_routes(vector_store, routed_sources)
+
+def update_duplicate_links(linked: dict, unlinked: dict):
+    """Add/remove duplicate IDs in the metadata of canonical chunks already in the DB."""
+    canonical_ids = set(linked) | set(unlinked)
+    if not canonical_ids:
+        return
+    collection = get_collection()
+    existing = collection.get(ids=list(canonical_ids), include=["metadatas"])
+
+    updated_ids, updated_metadatas = [], []
+    for chunk_id, metadata in zip(existing["ids"], existing["metadatas"]):
+        known = set(filter(None, (metadata.get("duplicate_ids") or "").split(DUPLICATE_ID_SEPARATOR)))
+        merged = (known - unlinked.get(chunk_id, set())) | linked.get(chunk_id, set())
+        if merged != known:
+            updated_ids.append(chunk_id)
+            updated_metadatas.append({**metadata, "duplicate_ids": DUPLICATE_ID_SEPARATOR.join(sorted(merged))})
+    if updated_ids:
+        collection.update(ids=updated_ids, metadatas=updated_metadatas)
 
 def calculate_chunk_ids(chunks):
 
@@ -122,6 +214,68 @@ def calculate_chunk_ids(chunks):
 
     return chunks
 
+def read_ingest_version():
+    version_path = os.path.join(CHROMA_PATH, INGEST_VERSION_FILE)
+    if not os.path.exists(version_path):
+        return None
+    with open(version_path, "r") as file:
+        return json.load(file)["ingest_version"]
+
+def write_ingest_version(version: str = INGEST_VERSION):
+    os.makedirs(CHROMA_PATH, exist_ok=True)
+    with open(os.path.join(CHROMA_PATH, INGEST_VERSION_FILE), "w") as file:
+        json.dump({"ingest_version": version}, file)
+
+def get_collection():
+    client = chromadb.PersistentClient(path=CHROMA_PATH)
+    return client.get_or_create_collection(COLLECTION_NAME)
+
+def read_snapshot_marker():
+    marker_path = os.path.join(CHROMA_PATH, SNAPSHOT_MARKER_FILE)
+    if not os.path.exists(marker_path):
+        return None
+    with open(marker_path, "r") as file:
+        return json.load(file)["snapshot_id"]
+
+def write_snapshot_marker(snapshot_id: str):
+    with open(os.path.join(CHROMA_PATH, SNAPSHOT_MARKER_FILE), "w") as file:
+        json.dump({"snapshot_id": snapshot_id}, file)
+
+def export_database(snapshot_path: str, base_path: str = None):
+    embeddings = get_embedding_function()
+    try:
+        manifest = export_snapshot(
+            get_collection(), snapshot_path, embeddings.model,
+            ingest_version=read_ingest_version(), base_path=base_path,
+        )
+    except (OSError, EOFError, KeyError, ValueError) as e:  # Existing target or unreadable base snapshot
+        print(f"❌ Could not export to {snapshot_path}: {e}")
+        return
+    kind = "delta" if manifest["base_snapshot"] else "full"
+    print(f"📦 Exported {kind} snapshot {manifest['snapshot_id']}: {manifest['count']} chunks, "
+          f"{len(manifest['deleted_ids'])} deletions -> {snapshot_path}")
+
+def import_database(snapshot_path: str):
+    embeddings = get_embedding_function()
+    collection = get_collection()
+    try:
+        manifest, touched_sources = import_snapshot(
+            collection, snapshot_path, embeddings.model, current_snapshot=read_snapshot_marker()
+        )
+    except (OSError, EOFError, KeyError, ValueError) as e:  # Missing/corrupt files; JSONDecodeError is a ValueError
+        print(f"❌ Could not import {snapshot_path}: {e}")
+        return
+    # Only an imported node is known to match the snapshot, so only import records it.
+    write_snapshot_marker(manifest["snapshot_id"])
+    if manifest["ingest_version"]:
+        write_ingest_version(manifest["ingest_version"])
+    print(f"📥 Imported snapshot {manifest['snapshot_id']}: {manifest['count']} chunks, "
+          f"{len(manifest['deleted_ids'])} deletions")
+
+    if touched_sources:
+        print(f"🧭 Updating routing index for {len(touched_sources)} document(s)")
+        build_document_routes(collection, touched_sources)
+
 def clear_database():
     if os.path.exists(CHROMA_PATH):
         shutil.rmtree(CHROMA_PATH)
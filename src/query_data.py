@@ -1,9 +1,13 @@
 import argparse
 import logging
+from functools import lru_cache
 from langchain_chroma import Chroma  # Updated import from langchain-chroma package
 from langchain.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 from get_embedding_function import get_embedding_function
+from document_router import COLLECTION_NAME, route_query
+from kv_cache import PrefixKVCache
+from speculative_decoding import assisted_generate, check_tokenizer_compatibility
 from transformers import GPT2LMHeadModel, GPT2Tokenizer, AutoModel, AutoTokenizer,AutoModelForCausalLM
 
 
@@ -14,6 +18,8 @@ logging.basicConfig(
 )
 
 CHROMA_PATH = "chroma"
+ROUTING_TOP_N = 3  # Number of documents whose chunks are searched per query
+RETRIEVAL_MODELS = ("mistral", "rag")  # Model choices that search the vector store before generating
 
 PROMPT_TEMPLATE = """
 Answer the question based only on the following context:
@@ -25,19 +31,29 @@ Answer the question based only on the following context:
 Answer the question based on the above context: {question}
 """
 
+# Static preamble and question tail around the context, used to build cacheable prompt prefixes.
+PROMPT_PREFIX, PROMPT_SUFFIX = PROMPT_TEMPLATE.split("{context}")
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+# Past key/values for the template preamble and recurring context blocks of local models.
+prefix_kv_cache = PrefixKVCache()
+
+@lru_cache(maxsize=None)
 def load_gpt_neo():
     """Load GPT-Neo model and tokenizer when needed."""
     logging.info("Loading GPT-Neo model and tokenizer...")
-    model = GPT2LMHeadModel.from_pretrained("EleutherAI/gpt-neo-125M")
+    model = AutoModelForCausalLM.from_pretrained("EleutherAI/gpt-neo-125M")
     tokenizer = GPT2Tokenizer.from_pretrained("EleutherAI/gpt-neo-125M")
     return model, tokenizer
 
+@lru_cache(maxsize=None)
 def load_distilgpt2():
     logging.info("Loading DistilGPT2 model and tokenizer...")
     model = GPT2LMHeadModel.from_pretrained("distilgpt2")
     tokenizer = GPT2Tokenizer.from_pretrained("distilgpt2")
     return model, tokenizer
 
+@lru_cache(maxsize=None)
 def load_mistral():
     logging.info("Loading Mistral mode and tokenizer...")
     tokenizer = AutoTokenizer.from_pretrained("mistralai/Mistral-7B-v0.1")
@@ -50,8 +66,28 @@ def load_minilm():
     tokenizer = AutoTokenizer.from_pretrained("sentence-transformers/all-MiniLM-L6-v2")
     return model, tokenizer
 
-def query_rag(query_text: str, model_choice: str) -> dict:
-    """Handle queries using either RAG pipeline or GPT-Neo."""
+def retrieve_chunks(query_text: str, k: int = 5) -> list:
+    """Route the query to its closest documents, then search chunks only within them."""
+    embedding_function = get_embedding_function()
+    db = Chroma(
+        collection_name=COLLECTION_NAME,
+        embedding_function=embedding_function,
+        persist_directory=CHROMA_PATH,
+    )
+    query_embedding = embedding_function.embed_query(query_text)
+
+    sources = route_query(query_embedding, ROUTING_TOP_N)
+    logging.info(f"Routing query to documents: {sources}")
+    # Without a routing index (older databases) fall back to searching the whole collection.
+    search_filter = {"source": {"$in": sources}} if sources else None
+
+    return db.similarity_search_by_vector_with_relevance_scores(query_embedding, k=k, filter=search_filter)
+
+def query_rag(query_text: str, model_choice: str, results: list = None) -> dict:
+    """Handle queries using either RAG pipeline or GPT-Neo.
+
+    Retrieval models reuse `results` (e.g. prefetched while the user was typing) when given.
+    """
     try:
         if model_choice == "mock":
             logging.info("Using mock response...")
@@ -61,29 +97,25 @@ def query_rag(query_text: str, model_choice: str) -> dict:
 
         elif model_choice == "mistral":
             logging.info("Performing Mistral RAG pipeline...")
-            # Initialize embedding function and database
-            embedding_function = get_embedding_function()
-            db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
             logging.info("Performing similarity search...")
-            results = db.similarity_search_with_score(query_text, k=5)
+            if results is None:
+                results = retrieve_chunks(query_text, k=5)
             logging.debug(f"Search results: {results}")
 
-            # Extract context from search results
-            context_text = "\n\n---\n\n".join([doc.page_content for doc, _score in results])
+            # Prepare the prompt as cacheable segments: the static preamble, then each context block
+            prefix_segments = [PROMPT_PREFIX] + [
+                (CONTEXT_SEPARATOR if i else "") + doc.page_content for i, (doc, _score) in enumerate(results)
+            ]
+            suffix = PROMPT_SUFFIX.format(question=query_text)
             logging.info("Context extracted for prompt")
 
-            # Prepare the prompt using context and the original query
-            prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
-            prompt = prompt_template.format(context=context_text, question=query_text)
-
-            # Load Mistral model
+            # Load Mistral model (kept in memory so its prefix cache stays valid across queries)
             model, tokenizer = load_mistral()
-            inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=512)
-            outputs = model.generate(inputs["input_ids"], max_length=512, num_return_sequences=1)
+            outputs = prefix_kv_cache.generate(model, tokenizer, prefix_segments, suffix, max_length=512, num_return_sequences=1)
             response = tokenizer.decode(outputs[0], skip_special_tokens=True)
 
             # Process metadata
-            sources = [doc.metadata.get("id", None) for doc, _score in results]
+            sources = [format_source(doc) for doc, _score in results]
             prettified_response = prettify_response(response, sources)
             return {"content": prettified_response, "error": None}
 
@@ -112,13 +144,25 @@ def query_rag(query_text: str, model_choice: str) -> dict:
             response = tokenizer.decode(outputs[0], skip_special_tokens=True)
             return {"content": response, "error": None}
 
+        elif model_choice == "assisted":
+            model, tokenizer = load_gpt_neo()
+            draft_model, draft_tokenizer = load_distilgpt2()
+            check_tokenizer_compatibility(draft_model, draft_tokenizer, model, tokenizer)
+            logging.info("Generating response using GPT-Neo assisted by DistilGPT2...")
+            inputs = tokenizer.encode(query_text, return_tensors="pt")
+            outputs, _stats = assisted_generate(
+                model, draft_model, inputs,
+                max_new_tokens=max(0, 50 - inputs.shape[1]),
+                eos_token_id=tokenizer.eos_token_id,
+            )
+            response = tokenizer.decode(outputs[0], skip_special_tokens=True)
+            return {"content": response, "error": None}
+
         elif model_choice == "rag":
             logging.info("Initializing RAG pipeline...")
-            embedding_function = get_embedding_function()
-            db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
-
             logging.info("Performing similarity search")
-            results = db.similarity_search_with_score(query_text, k=5)
+            if results is None:
+                results = retrieve_chunks(query_text, k=5)
             logging.debug(f"Search results: {results}")
 
             context_text = "\n\n---\n\n".join([doc.page_content for doc, _score in results])
@@ -132,7 +176,7 @@ def query_rag(query_text: str, model_choice: str) -> dict:
             response_text = model.invoke(prompt)
 
             logging.info("Processing sources metadata")
-            sources = [doc.metadata.get("id", None) for doc, _score in results]
+            sources = [format_source(doc) for doc, _score in results]
 
             logging.info("Prettifying response")
             prettified_response = prettify_response(response_text, sources)
@@ -148,6 +192,14 @@ def query_rag(query_text: str, model_choice: str) -> dict:
         logging.error(f"Error in query_rag: {e}")
         return {"content": None, "error": str(e)}
 
+def format_source(doc) -> str:
+    """Chunk ID of a search result, followed by the near-duplicate chunks linked to it at ingest."""
+    source = doc.metadata.get("id") or ""
+    duplicate_ids = doc.metadata.get("duplicate_ids")
+    if duplicate_ids:
+        source += f" (also in: {duplicate_ids})"
+    return source
+
 def prettify_response(raw_response, sources: list) -> str:
     """Prettify the raw response with source information."""
     logging.debug("Prettifying response")
@@ -173,7 +225,7 @@ def main():
     # Create CLI.
     parser = argparse.ArgumentParser()
     parser.add_argument("query_text", type=str, help="The query text.")
-    parser.add_argument("--model", type=str, choices=["mock", "gpt-neo", "rag", "minilm","distilgpt2"], default="distilgpt2", help="Model to use for query processing")
+    parser.add_argument("--model", type=str, choices=["mock", "gpt-neo", "rag", "minilm","distilgpt2", "assisted", "mistral"], default="distilgpt2", help="Model to use for query processing")
     args = parser.parse_args()
 
     query_text = args.query_text
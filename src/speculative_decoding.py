@@ -0,0 +1,143 @@
+import argparse
+import logging
+import time
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, DynamicCache
+
+NUM_DRAFT_TOKENS = 4  # Tokens proposed by the draft model per verification step
+
+def check_tokenizer_compatibility(draft_model, draft_tokenizer, target_model, target_tokenizer):
+    """Raise ValueError unless the draft and target models share one token space."""
+    if draft_tokenizer.get_vocab() != target_tokenizer.get_vocab():
+        raise ValueError("Draft and target tokenizers have different vocabularies")
+    if draft_tokenizer.eos_token_id != target_tokenizer.eos_token_id:
+        raise ValueError("Draft and target tokenizers use different end-of-sequence tokens")
+    if draft_model.config.vocab_size != target_model.config.vocab_size:
+        raise ValueError(
+            f"Draft vocab size {draft_model.config.vocab_size} does not match "
+            f"target vocab size {target_model.config.vocab_size}"
+        )
+
+def _truncate_cache(cache, keep: int):
+    # A negative crop removes tokens from the end; positive lengths are deprecated in transformers.
+    excess = cache.get_seq_length() - keep
+    if excess > 0:
+        cache.crop(-excess)
+
+@torch.no_grad()
+def assisted_generate(target_model, draft_model, input_ids, max_new_tokens: int,
+                      eos_token_id=None, num_draft_tokens: int = NUM_DRAFT_TOKENS):
+    """Greedy speculative decoding: the draft proposes tokens, the target verifies them in one pass.
+
+    Returns (output_ids, stats). The output matches greedy decoding with the target alone (see
+    verify_greedy_equivalence). This is hand-rolled rather than `generate(assistant_model=...)`
+    because that API does not expose how many drafted tokens were accepted, and it adapts the
+    draft length heuristically, which would make the reported acceptance rate meaningless.
+    """
+    start_time = time.perf_counter()
+    prompt_length = input_ids.shape[1]
+    target_cache, draft_cache = DynamicCache(), DynamicCache()
+    drafted = accepted = 0
+
+    while input_ids.shape[1] - prompt_length < max_new_tokens:
+        length = input_ids.shape[1]
+        budget = max_new_tokens - (length - prompt_length)
+        steps = min(num_draft_tokens, budget)
+
+        # Draft: feed whatever the draft cache has not seen yet, then extend one token at a time.
+        draft_tokens = []
+        next_input = input_ids[:, draft_cache.get_seq_length():]
+        for _ in range(steps):
+            logits = draft_model(input_ids=next_input, past_key_values=draft_cache, use_cache=True).logits
+            next_input = logits[:, -1:].argmax(dim=-1)
+            draft_tokens.append(next_input)
+        draft_tokens = torch.cat(draft_tokens, dim=1)
+
+        # Verify: one target forward pass scores every draft position plus one bonus position.
+        verify_input = torch.cat([input_ids[:, target_cache.get_seq_length():], draft_tokens], dim=1)
+        logits = target_model(input_ids=verify_input, past_key_values=target_cache, use_cache=True).logits
+        target_tokens = logits[:, -(steps + 1):].argmax(dim=-1)
+
+        matches = (draft_tokens == target_tokens[:, :steps])[0].tolist()
+        num_accepted = matches.index(False) if False in matches else steps
+        drafted += steps
+        accepted += num_accepted
+
+        # Keep the accepted draft tokens and the target's own token at the first mismatch.
+        new_tokens = target_tokens[:, :num_accepted + 1][:, :budget]
+        input_ids = torch.cat([input_ids, new_tokens], dim=1)
+
+        # Drop key/values computed for rejected draft tokens.
+        _truncate_cache(target_cache, length + num_accepted)
+        _truncate_cache(draft_cache, length + min(num_accepted, steps - 1))
+
+        if eos_token_id is not None and (new_tokens == eos_token_id).any():
+            eos_index = (input_ids[0, length:] == eos_token_id).nonzero()[0].item()
+            input_ids = input_ids[:, :length + eos_index + 1]
+            break
+
+    elapsed = time.perf_counter() - start_time
+    generated = input_ids.shape[1] - prompt_length
+    stats = {
+        "acceptance_rate": accepted / drafted if drafted else 0.0,
+        "tokens_per_second": generated / elapsed if elapsed > 0 else 0.0,
+        "generated_tokens": generated,
+    }
+    logging.info(
+        f"Assisted decoding: {generated} tokens, acceptance rate {stats['acceptance_rate']:.1%}, "
+        f"{stats['tokens_per_second']:.1f} tokens/sec"
+    )
+    return input_ids, stats
+
+@torch.no_grad()
+def verify_greedy_equivalence(target_model, draft_model, input_ids, max_new_tokens: int, eos_token_id=None) -> list:
+    """Compare assisted_generate with target greedy `generate` on one prompt; return failed case names.
+
+    Covers the plain token budget, a budget smaller than one draft round, and an EOS that stops
+    generation part-way (the third generated token is used as EOS so the path is always taken).
+    """
+    def reference(budget, eos):
+        return target_model.generate(
+            input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            max_new_tokens=budget,
+            do_sample=False,
+            eos_token_id=eos,
+            pad_token_id=eos if eos is not None else 0,
+        )
+
+    forced_eos = reference(max_new_tokens, eos_token_id)[0, input_ids.shape[1] + 2].item()
+    cases = {
+        "budget": (max_new_tokens, eos_token_id),
+        "short budget": (NUM_DRAFT_TOKENS - 1, eos_token_id),
+        "eos": (max_new_tokens, forced_eos),
+    }
+
+    failures = []
+    for name, (budget, eos) in cases.items():
+        expected = reference(budget, eos)
+        actual, _stats = assisted_generate(target_model, draft_model, input_ids, max_new_tokens=budget, eos_token_id=eos)
+        if not torch.equal(expected, actual):
+            logging.error(f"Assisted decoding differs from greedy ({name}): {expected.tolist()} != {actual.tolist()}")
+            failures.append(name)
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("prompt", nargs="?", default="Retrieval augmented generation is")
+    parser.add_argument("--target", default="EleutherAI/gpt-neo-125M")
+    parser.add_argument("--draft", default="distilgpt2")
+    parser.add_argument("--max-new-tokens", type=int, default=30)
+    args = parser.parse_args()
+
+    target_model = AutoModelForCausalLM.from_pretrained(args.target)
+    draft_model = AutoModelForCausalLM.from_pretrained(args.draft)
+    tokenizer = AutoTokenizer.from_pretrained(args.target)
+    check_tokenizer_compatibility(draft_model, AutoTokenizer.from_pretrained(args.draft), target_model, tokenizer)
+
+    input_ids = tokenizer.encode(args.prompt, return_tensors="pt")
+    failures = verify_greedy_equivalence(target_model, draft_model, input_ids, args.max_new_tokens, tokenizer.eos_token_id)
+    print("❌ Mismatch in: " + ", ".join(failures) if failures else "✅ Assisted output matches greedy decoding")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import re
+from bisect import bisect_left
+from collections import deque
+from functools import lru_cache
+import tiktoken
+
+ENCODING_NAME = "cl100k_base"  # Tokenizer used by text-embedding-3-large
+CHUNK_TOKENS = 200  # Roughly the old 800-character chunks
+OVERLAP_TOKENS = 20  # Roughly the old 80-character overlap
+# Chunk IDs are positional, so any change to how pages are chunked must bump this.
+CHUNKER_VERSION = f"tokens-{CHUNK_TOKENS}-{OVERLAP_TOKENS}-v1"
+
+# One unit is a sentence or the text up to a paragraph break, together with its trailing
+# whitespace, so joining units back together reproduces the original layout.
+# Possessive runs keep the match linear: stop at [.!?] followed by whitespace or at a blank line.
+UNIT_PATTERN = re.compile(r"\S(?:[^.!?\n]++|[.!?]++(?!\s)|\n(?!\s*\n))*+[.!?]*+\s*")
+
+@lru_cache(maxsize=None)
+def get_encoding():
+    return tiktoken.get_encoding(ENCODING_NAME)
+
+def _split_long_word(word: str, encoding, chunk_tokens: int):
+    # Start from the character offsets where tokens begin so multi-byte characters stay whole,
+    # then shrink any piece whose own encoding still exceeds the budget.
+    _text, offsets = encoding.decode_with_offsets(encoding.encode_ordinary(word))
+    start = 0
+    while start < len(word):
+        token_index = bisect_left(offsets, start) + chunk_tokens
+        end = offsets[token_index] if token_index < len(offsets) else len(word)
+        end = max(end, start + 1)
+        piece_tokens = len(encoding.encode_ordinary(word[start:end]))
+        while piece_tokens > chunk_tokens and end - start > 1:
+            end -= 1
+            piece_tokens = len(encoding.encode_ordinary(word[start:end]))
+        yield word[start:end], piece_tokens
+        start = end
+
+def iter_units(text: str, chunk_tokens: int):
+    """Yield (unit text, token count); units longer than a chunk are broken into words.
+
+    Each unit is encoded once. Only the rare unit longer than a chunk is encoded again word by
+    word, and words that are longer than a chunk on their own are cut on character boundaries.
+    """
+    encoding = get_encoding()
+    for match in UNIT_PATTERN.finditer(text):
+        unit = match.group()
+        unit_tokens = len(encoding.encode_ordinary(unit))
+        if unit_tokens <= chunk_tokens:
+            yield unit, unit_tokens
+            continue
+        for word in re.findall(r"\S+\s*", unit):
+            word_tokens = len(encoding.encode_ordinary(word))
+            if word_tokens <= chunk_tokens:
+                yield word, word_tokens
+            else:
+                yield from _split_long_word(word, encoding, chunk_tokens)
+
+def _join_window(window, window_tokens: int) -> tuple[str, int]:
+    return "".join(unit for unit, _ in window).strip(), window_tokens
+
+def split_text(text: str, chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: int = OVERLAP_TOKENS) -> list[tuple[str, int]]:
+    """Split text into (chunk, token count) pairs in a single pass over its sentences.
+
+    Chunks end on sentence or paragraph boundaries whenever a sentence fits in a chunk, and
+    consecutive chunks share up to overlap_tokens worth of trailing sentences. Token counts are
+    the sum of the unit counts, so the chunk text is never re-encoded. Units end in whitespace,
+    which GPT-style pre-tokenization does not merge into the next word, so the sum is an upper
+    bound on the token count of the returned (stripped) chunk and safe for prompt budgeting.
+    """
+    chunks = []
+    window = deque()
+    window_tokens = 0
+    has_new_units = False
+
+    for unit, unit_tokens in iter_units(text, chunk_tokens):
+        if window and window_tokens + unit_tokens > chunk_tokens:
+            chunks.append(_join_window(window, window_tokens))
+            has_new_units = False
+            # Keep only the trailing units that fit in the overlap and leave room for this unit.
+            while window and (window_tokens > overlap_tokens or window_tokens + unit_tokens > chunk_tokens):
+                window_tokens -= window.popleft()[1]
+
+        window.append((unit, unit_tokens))
+        window_tokens += unit_tokens
+        has_new_units = True
+
+    if has_new_units:
+        chunks.append(_join_window(window, window_tokens))
+
+    return chunks